@@ -6,31 +6,36 @@ Uses bleak library directly - works with stock LEGO firmware (no flashing requir
 """
 
 import asyncio
+import re
 import time
 from bleak import BleakScanner, BleakClient
 
 # LEGO Powered Up characteristic UUID for sending commands
 LEGO_CHARACTERISTIC_UUID = "00001624-1212-efde-1623-785feabcd123"
 
+# Advertised names that identify a LEGO hub
+HUB_RE = re.compile(r"TRAIN|HUB|MOVE|CITY|LEGO", re.IGNORECASE)
+
 # Speed as percentage (-100 to 100)
 FORWARD_SPEED = 50
 REVERSE_SPEED = -50
 PORT = 0x00  # Port A (0x00), Port B is 0x01
 
+# Working command format discovered from testing:
+# [length, hub_id, message_type, port, mode, startup_completion, power, max_power, use_profile]
+# 0x11 = write direct mode data
+# 0x01 = execute immediately with command feedback
+# Every possible motor command, precomputed so speed changes are a dict lookup
+_CMD_CACHE = {
+    (port, speed): bytes([0x08, 0x00, 0x81, port, 0x11, 0x01, (256 + speed) if speed < 0 else speed, 0x64, 0x7f])
+    for port in (0x00, 0x01)
+    for speed in range(-100, 101)
+}
+
 def create_motor_command(port, speed):
     """Create a motor control command for LEGO Powered Up."""
-    # Convert speed percentage to motor value (-100 to 100)
-    speed_value = max(-100, min(100, int(speed)))
-    if speed_value < 0:
-        speed_byte = 256 + speed_value  # Convert to unsigned byte
-    else:
-        speed_byte = speed_value
-    
-    # Working command format discovered from testing:
-    # [length, hub_id, message_type, port, mode, startup_completion, power, max_power, use_profile]
-    # 0x11 = write direct mode data
-    # 0x01 = execute immediately with command feedback
-    return bytes([0x08, 0x00, 0x81, port, 0x11, 0x01, speed_byte, 0x64, 0x7f])
+    # Clamp speed percentage to motor value (-100 to 100)
+    return _CMD_CACHE[(port, max(-100, min(100, int(speed))))]
 
 async def control_train():
     """Main async function to control the train."""
@@ -39,44 +44,44 @@ async def control_train():
         print("Scanning for LEGO Powered Up hub via Bluetooth...")
         print("(Make sure your train hub is powered on)")
         
-        devices = await BleakScanner.discover(timeout=10.0)
-        
-        lego_device = None
-        
-        # Try to find LEGO device by name
-        for device in devices:
-            if device.name and any(keyword in device.name.upper() for keyword in ["TRAIN", "HUB", "MOVE", "CITY", "LEGO"]):
-                lego_device = device
-                print(f"Found LEGO device: {device.name}")
-                break
+        # Stop scanning as soon as a matching hub shows up
+        lego_device = await BleakScanner.find_device_by_filter(
+            lambda device, advertisement_data: bool(device.name and HUB_RE.search(device.name)),
+            timeout=10.0,
+        )
         
         if not lego_device:
             print("✗ No LEGO Powered Up hub found!")
             return 1
         
+        print(f"Found LEGO device: {lego_device.name}")
         print(f"✓ Connecting to {lego_device.name}...")
         
         async with BleakClient(lego_device.address) as client:
             print("✓ Connected to hub successfully!")
             
+            # Motor commands are sent as write-without-response (no ACK round trip)
+            # to the command characteristic, resolved once up front
+            lego_char = client.services.get_characteristic(LEGO_CHARACTERISTIC_UUID) or LEGO_CHARACTERISTIC_UUID
+            
             print("\nStarting train control sequence...")
             
             # Go forward for 5 seconds
             print(f"→ Going forward at speed {FORWARD_SPEED}%")
             command = create_motor_command(PORT, FORWARD_SPEED)
-            await client.write_gatt_char(LEGO_CHARACTERISTIC_UUID, command)
+            await client.write_gatt_char(lego_char, command, response=False)
             await asyncio.sleep(5)
             
             # Go reverse for 5 seconds
             print(f"← Going reverse at speed {REVERSE_SPEED}%")
             command = create_motor_command(PORT, REVERSE_SPEED)
-            await client.write_gatt_char(LEGO_CHARACTERISTIC_UUID, command)
+            await client.write_gatt_char(lego_char, command, response=False)
             await asyncio.sleep(5)
             
             # Stop the motor
             print("■ Stopping train...")
             command = create_motor_command(PORT, 0)
-            await client.write_gatt_char(LEGO_CHARACTERISTIC_UUID, command)
+            await client.write_gatt_char(lego_char, command, response=False)
             
             print("\n✓ Train control complete!")
         
@@ -5,125 +5,480 @@ A kid-friendly Flask web interface for controlling a LEGO train.
 """
 
 import asyncio
+import atexit
+import glob
+import itertools
+import os
+import re
+import signal
+import sys
 import threading
-from flask import Flask, render_template, jsonify, request
+import time
+import orjson
+from flask import Flask, render_template, request
+from flask_sock import Sock
 from bleak import BleakScanner, BleakClient
 
+try:
+    import uvloop  # Faster libuv-based event loop (not available on Windows)
+except ImportError:
+    uvloop = None
+
 app = Flask(__name__)
+sock = Sock(app)
 
 # LEGO Powered Up configuration
 LEGO_CHARACTERISTIC_UUID = "00001624-1212-efde-1623-785feabcd123"
 PORT = 0x00  # Port A
+HUB_RE = re.compile(r"TRAIN|HUB|MOVE|CITY|LEGO", re.IGNORECASE)  # Advertised hub names
+
+class Train:
+    """State for one connected (or previously connected) train hub."""
+    
+    # Slots keep per-command attribute access cheap and catch typos
+    __slots__ = (
+        'client', 'device', 'address', 'speed', 'name', 'char', 'last_command',
+        'pending_speed', 'speed_event', 'speed_worker', 'lock',
+        'notifying', 'battery_level', 'battery_raw', 'battery_ts', 'battery_error',
+    )
+    
+    def __init__(self, address, name):
+        self.client = None
+        self.device = None
+        self.address = address
+        self.speed = 0
+        self.name = name
+        self.char = None
+        self.last_command = None
+        self.pending_speed = 0
+        self.speed_event = asyncio.Event()  # Must be created on the background loop
+        self.speed_worker = None
+        self.lock = asyncio.Lock()  # Serializes GATT operations on this hub
+        self.notifying = False  # Whether notifications are active on the current connection
+        self.battery_level = None
+        self.battery_raw = None
+        self.battery_ts = None
+        self.battery_error = None
 
 # Global state - support for unlimited trains
-trains = {}  # Dynamic dict: {address: {'client': ..., 'device': ..., 'speed': ..., 'name': ...}}
+trains = {}  # Dynamic dict: {address: Train}
 train_counter = 0
 background_loop = None
 background_thread = None
+_loop_ready = threading.Event()  # Set once the background loop is running
+
+# Long-lived BLE scanner - hub advertisements are collected continuously
+# instead of starting a fresh scan for every connect/scan request
+_scanner = None
+_scanner_start = None  # asyncio.Task for the current (or last) scanner (re)start
+_scanner_active_at = 0.0  # Last scanner start or hub advertisement (monotonic)
+_seen_devices = {}  # {address: (BLEDevice, last_seen)}
+_device_seen = None  # asyncio.Event, set whenever a hub advertisement arrives
+SEEN_DEVICE_TTL = 10.0  # Seconds before an advertisement is considered stale
+SCAN_TIMEOUT = 5.0  # Seconds to wait for new hubs before settling for what's been seen
+BATTERY_REFRESH_INTERVAL = 30.0  # Seconds before a cached battery level is re-requested
+CONN_INTERVAL = 6  # Preferred BLE connection interval in 1.25 ms units (7.5 ms)
+FAST_BLE_ENV = 'LEGOTRAINS_FAST_BLE_INTERVAL'  # Set to 1 to opt in to CONN_INTERVAL on Linux
+CONNECT_TIMEOUT = 10.0  # Seconds Bleak may spend establishing one connection
+SCAN_CONNECT_BUDGET = 25.0  # Seconds /api/connect and /api/scan wait for discovery plus connects
+
+# Snapshot of the /api/status payload, rebuilt only when train state changes
+_status_snapshot = ({'status': 'success', 'connected_count': 0, 'trains': {}}, None)  # (payload, etag)
+_status_versions = itertools.count(1)
+_status_lock = threading.Lock()  # Rebuilds happen on Flask threads and the loop thread
+_status_epoch = time.time_ns()  # Keeps ETags from one run from matching the next
+
+# Every possible motor command, precomputed so speed changes are a dict lookup
+_CMD_CACHE = {
+    (port, speed): bytes([0x08, 0x00, 0x81, port, 0x11, 0x01, (256 + speed) if speed < 0 else speed, 0x64, 0x7f])
+    for port in (0x00, 0x01)
+    for speed in range(-100, 101)
+}
 
 def create_motor_command(port, speed):
     """Create a motor control command for LEGO Powered Up."""
-    speed_value = max(-100, min(100, int(speed)))
-    if speed_value < 0:
-        speed_byte = 256 + speed_value
-    else:
-        speed_byte = speed_value
+    return _CMD_CACHE[(port, max(-100, min(100, int(speed))))]
+
+def _json(obj, status=200):
+    """Build a JSON response, encoded with orjson rather than Flask's encoder."""
+    return app.response_class(orjson.dumps(obj), status=status, mimetype='application/json')
+
+def _refresh_status_cache():
+    """Rebuild the cached /api/status payload after a train state change."""
+    global _status_snapshot
     
-    return bytes([0x08, 0x00, 0x81, port, 0x11, 0x01, speed_byte, 0x64, 0x7f])
+    # Build and publish under one lock so a slower rebuild can't overwrite
+    # a newer snapshot with older state
+    with _status_lock:
+        train_status = {
+            train_id: {
+                'connected': train.client is not None and train.client.is_connected,
+                'speed': train.speed,
+                'name': train.name
+            }
+            for train_id, train in list(trains.items())
+        }
+        
+        _status_snapshot = ({
+            'status': 'success',
+            'connected_count': sum(1 for t in train_status.values() if t['connected']),
+            'trains': train_status
+        }, f"{_status_epoch}-{next(_status_versions)}")
+
+def configure_connection_interval():
+    """Ask the Linux Bluetooth stack for the shortest LE connection interval.
+    
+    BlueZ has no per-connection API for this, but the kernel applies the
+    defaults in debugfs to every new LE connection, so this must run before
+    connecting. These are host-wide defaults that affect every LE device,
+    so it's opt-in via FAST_BLE_ENV, needs root (and debugfs), and the
+    previous values are written back when the app exits.
+    """
+    if os.environ.get(FAST_BLE_ENV) != '1' or not sys.platform.startswith('linux'):
+        return
+    
+    # /sys/kernel/debug is root-only, so the adapters can't even be listed
+    if os.geteuid() != 0:
+        print("Not running as root - leaving the BLE connection interval at the system default")
+        return
+    
+    configured = 0
+    for adapter in glob.glob('/sys/kernel/debug/bluetooth/hci*'):
+        try:
+            previous = {}
+            for param in ('conn_min_interval', 'conn_max_interval', 'conn_latency'):
+                with open(f'{adapter}/{param}') as f:
+                    previous[param] = f.read().strip()
+        except OSError as e:
+            print(f"Could not read {param} on {adapter}: {e}")
+            continue
+        
+        # min before max: the kernel rejects a min above the current max
+        try:
+            for param, value in [('conn_min_interval', CONN_INTERVAL),
+                                 ('conn_max_interval', CONN_INTERVAL),
+                                 ('conn_latency', 0)]:
+                with open(f'{adapter}/{param}', 'w') as f:
+                    f.write(str(value))
+        except OSError as e:
+            print(f"Could not set {param} on {adapter}: {e}")
+            _restore_connection_interval(adapter, previous)
+            continue
+        
+        atexit.register(_restore_connection_interval, adapter, previous)
+        configured += 1
+    
+    if configured:
+        # atexit doesn't run on SIGTERM; exit normally so the defaults are restored
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    else:
+        print("No Bluetooth adapter in debugfs could be configured - leaving the BLE connection interval at the system default")
+
+def _restore_connection_interval(adapter, previous):
+    """Write back the connection defaults saved by configure_connection_interval."""
+    # max before min: the old min must never end up above the current max
+    for param in ('conn_max_interval', 'conn_min_interval', 'conn_latency'):
+        try:
+            with open(f'{adapter}/{param}', 'w') as f:
+                f.write(previous[param])
+        except OSError as e:
+            print(f"Could not restore {param} on {adapter}: {e}")
 
 def start_background_loop():
     """Start a background event loop for async operations."""
     global background_loop
-    background_loop = asyncio.new_event_loop()
+    background_loop = uvloop.new_event_loop() if uvloop else asyncio.new_event_loop()
     asyncio.set_event_loop(background_loop)
+    background_loop.create_task(_start_scanner_on_startup())
+    background_loop.call_soon(_loop_ready.set)
     background_loop.run_forever()
 
-def run_coroutine_threadsafe(coro):
+def run_coroutine_threadsafe(coro, timeout=10):
     """Run a coroutine in the background event loop."""
     if background_loop is None:
         raise Exception("Background loop not started")
     future = asyncio.run_coroutine_threadsafe(coro, background_loop)
-    return future.result(timeout=10)
+    return future.result(timeout=timeout)
 
-async def find_trains():
-    """Find all LEGO train hubs."""
-    devices = await BleakScanner.discover(timeout=10.0)
+def submit_coroutine(coro):
+    """Schedule a coroutine on the background event loop without waiting for it.
     
-    found_trains = []
-    for device in devices:
-        if device.name and any(keyword in device.name.upper() for keyword in ["TRAIN", "HUB", "MOVE", "CITY", "LEGO"]):
-            found_trains.append(device)
+    For writes where the caller only needs the command queued; failures are
+    logged rather than reported back.
+    """
+    if background_loop is None:
+        raise Exception("Background loop not started")
+    future = asyncio.run_coroutine_threadsafe(coro, background_loop)
+    future.add_done_callback(_log_future_error)
+
+def _log_future_error(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Background task failed: {future.exception()}")
+
+def _on_advertisement(device, advertisement_data):
+    """Record advertisements from LEGO hubs seen by the shared scanner."""
+    global _scanner_active_at
+    
+    if device.name and HUB_RE.search(device.name):
+        now = time.monotonic()
+        _seen_devices[device.address] = (device, now)
+        _scanner_active_at = now
+        _device_seen.set()
+
+async def start_scanner():
+    """Make sure the shared BLE scanner is running, restarting it if needed.
+    
+    The scanner is (re)started if it never started, if the last start
+    failed, or if no hub advertisement has arrived for SEEN_DEVICE_TTL (the
+    adapter may have been powered off or discovery stopped underneath us).
+    Concurrent callers share one start, and start errors are raised to all
+    of them.
+    """
+    global _scanner_start
+    
+    if _scanner_start is None or (_scanner_start.done() and (
+        _scanner_start.cancelled()
+        or _scanner_start.exception() is not None
+        or time.monotonic() - _scanner_active_at >= SEEN_DEVICE_TTL
+    )):
+        _scanner_start = asyncio.ensure_future(_restart_scanner())
+    
+    await asyncio.shield(_scanner_start)
+
+async def _restart_scanner():
+    """Stop the shared scanner (if any) and start a fresh one."""
+    global _scanner, _device_seen, _scanner_active_at
+    
+    if _device_seen is None:
+        _device_seen = asyncio.Event()
+    
+    if _scanner is not None:
+        old_scanner, _scanner = _scanner, None
+        try:
+            await old_scanner.stop()
+        except Exception as e:
+            print(f"Failed to stop Bluetooth scanner: {e}")
+    
+    scanner = BleakScanner(detection_callback=_on_advertisement)
+    await scanner.start()
+    _scanner = scanner
+    _scanner_active_at = time.monotonic()
+
+async def _start_scanner_on_startup():
+    """Start the shared scanner eagerly, logging instead of failing.
     
-    return found_trains
+    If it can't start now (e.g. Bluetooth is off), find_trains retries and
+    reports the error on the next connect/scan request.
+    """
+    try:
+        await start_scanner()
+    except Exception as e:
+        print(f"Failed to start Bluetooth scanner: {e}")
 
-async def connect_to_train(address):
+async def find_trains(timeout=SCAN_TIMEOUT, on_found=None):
+    """Find all LEGO train hubs.
+    
+    Returns as soon as the expected number of hubs has been seen by the
+    shared scanner instead of always waiting for the full timeout; hitting
+    the timeout just means fewer (possibly no) new hubs were found. If
+    given, on_found is called with each hub as soon as it's seen (possibly
+    more than once per hub) so work can start while the scan continues.
+    """
+    await start_scanner()
+    
+    # Known trains that have dropped off need to be found again; otherwise
+    # we're looking for at least one new hub
+    connected = {address for address, t in trains.items() if t.client and t.client.is_connected}
+    expected = max(1, len(trains) - len(connected))
+    deadline = time.monotonic() + timeout
+    
+    while True:
+        now = time.monotonic()
+        found_trains = [
+            device for device, last_seen in _seen_devices.values()
+            if now - last_seen < SEEN_DEVICE_TTL
+        ]
+        
+        if on_found is not None:
+            for device in found_trains:
+                on_found(device)
+        
+        new_count = sum(1 for device in found_trains if device.address not in connected)
+        if new_count >= expected or now >= deadline:
+            return found_trains
+        
+        # Wait for more advertisements to arrive
+        _device_seen.clear()
+        try:
+            await asyncio.wait_for(_device_seen.wait(), timeout=deadline - now)
+        except asyncio.TimeoutError:
+            pass
+
+async def ensure_discovered(timeout=SCAN_TIMEOUT, on_found=None):
+    """Discover LEGO hubs that aren't already connected.
+    
+    on_found is passed through to find_trains, but only for those hubs.
+    """
+    def is_new(device):
+        return not (device.address in trains and trains[device.address].client and trains[device.address].client.is_connected)
+    
+    def on_found_new(device):
+        if is_new(device):
+            on_found(device)
+    
+    found_trains = await find_trains(timeout, on_found=on_found_new if on_found else None)
+    return [device for device in found_trains if is_new(device)]
+
+async def connect_to_train(address, device=None):
     """Connect to a specific LEGO train hub by address."""
     global trains, train_counter
     
     # Check if already connected
-    if address in trains and trains[address]['client'] and trains[address]['client'].is_connected:
+    if address in trains and trains[address].client and trains[address].client.is_connected:
         return address
     
     # Create new train entry if needed
     if address not in trains:
         train_counter += 1
-        trains[address] = {
-            'client': None,
-            'device': None,
-            'speed': 0,
-            'name': f'Train {train_counter}',
-            'last_command': None
-        }
+        # Name new trains after the hub's advertised name from the start, so a
+        # failed first connect doesn't leave them stuck with the placeholder
+        name = (device.name if device is not None else None) or f'Train {train_counter}'
+        trains[address] = Train(address, name)
+        trains[address].speed_worker = asyncio.ensure_future(speed_worker(address))
     
-    # Connect to the device
-    trains[address]['client'] = BleakClient(address)
-    await trains[address]['client'].connect()
+    if device is not None:
+        trains[address].device = device
     
-    return address if trains[address]['client'].is_connected else None
+    # Connect straight to the known device - given a bare address string,
+    # BleakClient has to scan for the hub again before it can connect
+    trains[address].client = BleakClient(
+        trains[address].device or address,
+        disconnected_callback=lambda client: _refresh_status_cache(),
+        timeout=CONNECT_TIMEOUT
+    )
+    await trains[address].client.connect()
+    
+    # Resolve the command characteristic once so writes skip the UUID lookup
+    trains[address].char = (
+        trains[address].client.services.get_characteristic(LEGO_CHARACTERISTIC_UUID)
+        or LEGO_CHARACTERISTIC_UUID
+    )
+    
+    # Subscribe to hub notifications once per connection; battery replies are
+    # cached on the train as they arrive
+    trains[address].notifying = False
+    try:
+        await start_notifications(trains[address])
+        await request_battery_level(trains[address])
+    except Exception as e:
+        trains[address].battery_error = str(e)
+    
+    _refresh_status_cache()
+    
+    return address if trains[address].client.is_connected else None
 
 async def scan_and_connect_trains():
     """Scan for and connect to all available LEGO trains."""
-    found_trains = await find_trains()
-    
-    if not found_trains:
-        return 0
-    
-    connected_count = 0
-    for device in found_trains:
-        # Skip if already connected
-        if device.address in trains and trains[device.address]['client'] and trains[device.address]['client'].is_connected:
-            continue
-        
+    async def connect_device(address, device):
         try:
-            train_id = await connect_to_train(device.address)
-            if train_id:
-                trains[train_id]['device'] = device
-                trains[train_id]['name'] = device.name or trains[train_id]['name']
-                connected_count += 1
+            if await connect_to_train(address, device):
+                return 1
         except Exception as e:
-            print(f"Failed to connect to {device.name}: {e}")
-            continue
+            print(f"Failed to connect to {address}: {e}")
+        return 0
     
-    return connected_count
-
-async def set_train_speed(train_id, speed):
-    """Set the train speed for a specific train."""
-    global trains
+    # Start connecting to each hub the moment it's seen, overlapping the
+    # connects with the rest of the scan. Known trains only come through here
+    # while they're advertising, so powered-off ones aren't retried.
+    connect_tasks = {}
+    
+    def connect_found(device):
+        if device.address not in connect_tasks:
+            connect_tasks[device.address] = asyncio.ensure_future(connect_device(device.address, device))
+    
+    await ensure_discovered(on_found=connect_found)
+    results = await asyncio.gather(*connect_tasks.values())
     
+    _refresh_status_cache()
+    
+    return sum(results)
+
+def check_train_connected(train_id):
+    """Return the train for train_id, raising if it's unknown or not connected."""
     if train_id not in trains:
         raise Exception(f"Train {train_id} not found")
     
     train = trains[train_id]
     
-    if not train['client'] or not train['client'].is_connected:
+    if not train.client or not train.client.is_connected:
         raise Exception(f"Not connected to train {train_id}")
     
+    return train
+
+async def set_train_speed(train_id, speed):
+    """Set the train speed for a specific train.
+    
+    The speed is queued for the train's speed worker rather than written
+    here, so rapid slider updates collapse into a single write of the
+    latest value.
+    """
+    train = check_train_connected(train_id)
+    train.pending_speed = speed
+    train.speed_event.set()
+
+async def speed_worker(train_id):
+    """Write the most recently requested speed to a train, dropping stale ones."""
+    train = trains[train_id]
+    
+    while True:
+        await train.speed_event.wait()
+        train.speed_event.clear()
+        speed = train.pending_speed
+        
+        try:
+            await write_train_speed(train, speed)
+        except Exception as e:
+            print(f"Failed to set speed for {train.name}: {e}")
+
+async def write_train_speed(train, speed):
+    """Send a motor command to a train."""
     command = create_motor_command(PORT, speed)
-    await train['client'].write_gatt_char(LEGO_CHARACTERISTIC_UUID, command)
-    train['speed'] = speed
+    # Motor commands are fire-and-forget: write without response so the
+    # write isn't held up waiting for an ACK from the hub
+    async with train.lock:
+        await train.client.write_gatt_char(train.char, command, response=False)
+    train.speed = speed
     
     # Store last command for debug
-    train['last_command'] = command.hex()
+    train.last_command = command.hex()
+    
+    _refresh_status_cache()
+
+def _make_notification_handler(train):
+    """Create a notification handler that updates train state."""
+    def notification_handler(sender, data):
+        # Battery level response format: [0x06, 0x00, 0x01, 0x06, 0x06, battery_percent]
+        if len(data) >= 6 and data[0] == 0x06 and data[3] == 0x06:
+            train.battery_level = data[5]
+            train.battery_raw = data.hex()
+            train.battery_ts = time.monotonic()
+            train.battery_error = None
+            print(f"Battery for {train.name}: {data.hex()} - Level: {data[5]}%")
+    
+    return notification_handler
+
+async def start_notifications(train):
+    """Subscribe to hub notifications on the train's current connection."""
+    async with train.lock:
+        await train.client.start_notify(train.char, _make_notification_handler(train))
+    train.notifying = True
+
+async def request_battery_level(train):
+    """Ask the hub to report its battery level via notification."""
+    # Request hub properties - battery level (0x06)
+    hub_info_request = bytes([0x05, 0x00, 0x01, 0x06, 0x02])
+    async with train.lock:
+        await train.client.write_gatt_char(train.char, hub_info_request, response=True)
 
 async def get_train_info(train_id):
     """Get detailed information about a train."""
@@ -134,61 +489,42 @@ async def get_train_info(train_id):
     
     train = trains[train_id]
     
-    if not train['client'] or not train['client'].is_connected:
+    if not train.client or not train.client.is_connected:
         return None
     
-    # Initialize battery tracking if not present
-    if 'battery_level' not in train:
-        train['battery_level'] = None
-        train['battery_raw'] = None
-    
-    # Define notification handler that updates train state
-    def notification_handler(sender, data):
-        # Battery level response format: [0x06, 0x00, 0x01, 0x06, 0x06, battery_percent]
-        if len(data) >= 6 and data[0] == 0x06 and data[3] == 0x06:
-            train['battery_level'] = data[5]
-            train['battery_raw'] = data.hex()
-            print(f"Battery for {train['name']}: {data.hex()} - Level: {data[5]}%")
+    # Retry the subscription if it failed at connect time - without it no
+    # battery reply can arrive, so there's no point requesting one
+    if not train.notifying:
+        try:
+            await start_notifications(train)
+        except Exception as e:
+            train.battery_error = str(e)
     
-    try:
-        # Try to start notifications, ignore if already started
+    # Refresh the battery level in the background if the cached one is stale;
+    # the reply arrives via the notification handler
+    if train.notifying and (train.battery_ts is None or time.monotonic() - train.battery_ts >= BATTERY_REFRESH_INTERVAL):
         try:
-            await train['client'].start_notify(LEGO_CHARACTERISTIC_UUID, notification_handler)
-            await asyncio.sleep(0.1)  # Let notifications settle
-        except Exception as notify_err:
-            # Ignore "already started" errors
-            if "already started" not in str(notify_err).lower():
-                raise
-        
-        # Request hub properties - battery level (0x06)
-        hub_info_request = bytes([0x05, 0x00, 0x01, 0x06, 0x02])
-        await train['client'].write_gatt_char(LEGO_CHARACTERISTIC_UUID, hub_info_request)
-        
-        # Wait longer for response
-        await asyncio.sleep(1.0)
-            
-    except Exception as e:
-        # Don't show "already started" as an error
-        if "already started" not in str(e).lower():
-            train['battery_error'] = str(e)
+            await request_battery_level(train)
+        except Exception as e:
+            train.battery_error = str(e)
     
     # Build info dict
     info = {
-        'name': train['name'],
-        'speed': train['speed'],
+        'name': train.name,
+        'speed': train.speed,
         'connected': True,
-        'address': train['device'].address if train['device'] else None,
-        'last_command': train.get('last_command', 'None'),
+        'address': train.address,
+        'last_command': train.last_command or 'None',
     }
     
-    if train['battery_level'] is not None:
-        info['battery_level'] = f"{train['battery_level']}%"
-        info['battery_raw'] = train['battery_raw']
+    if train.battery_level is not None:
+        info['battery_level'] = f"{train.battery_level}%"
+        info['battery_raw'] = train.battery_raw
     else:
         info['battery_level'] = 'No response'
     
-    if 'battery_error' in train:
-        info['battery_error'] = train['battery_error']
+    if train.battery_error is not None:
+        info['battery_error'] = train.battery_error
     
     return info
 
@@ -200,49 +536,50 @@ def index():
 @app.route('/api/status', methods=['GET'])
 def status():
     """Get the current status of all trains."""
-    connected_count = sum(1 for t in trains.values() if t['client'] is not None and t['client'].is_connected)
+    payload, etag = _status_snapshot
     
-    return jsonify({
-        'status': 'success',
-        'connected_count': connected_count,
-        'trains': {
-            train_id: {
-                'connected': train['client'] is not None and train['client'].is_connected,
-                'speed': train['speed'],
-                'name': train['name']
-            }
-            for train_id, train in trains.items()
-        }
-    })
+    if etag is None:
+        _refresh_status_cache()
+        payload, etag = _status_snapshot
+    
+    # Pollers that already have this snapshot get an empty 304
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        response = _json(payload)
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/api/connect', methods=['POST'])
 def connect():
     """Connect to all available trains."""
     try:
-        count = run_coroutine_threadsafe(scan_and_connect_trains())
+        count = run_coroutine_threadsafe(scan_and_connect_trains(), timeout=SCAN_CONNECT_BUDGET)
         
         if count > 0 or len(trains) > 0:
-            total_connected = sum(1 for t in trains.values() if t['client'] and t['client'].is_connected)
-            return jsonify({
+            total_connected = sum(1 for t in trains.values() if t.client and t.client.is_connected)
+            return _json({
                 'status': 'success', 
                 'message': f'Connected to {total_connected} train(s)',
                 'count': total_connected
             })
         else:
-            return jsonify({'status': 'error', 'message': 'No trains found'}), 404
+            return _json({'status': 'error', 'message': 'No trains found'}, 404)
     except Exception as e:
         import traceback
         traceback.print_exc()
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return _json({'status': 'error', 'message': str(e)}, 500)
 
 @app.route('/api/scan', methods=['POST'])
 def scan_more():
     """Scan for additional trains and connect them."""
     try:
-        new_count = run_coroutine_threadsafe(scan_and_connect_trains())
-        total_connected = sum(1 for t in trains.values() if t['client'] and t['client'].is_connected)
+        new_count = run_coroutine_threadsafe(scan_and_connect_trains(), timeout=SCAN_CONNECT_BUDGET)
+        total_connected = sum(1 for t in trains.values() if t.client and t.client.is_connected)
         
-        return jsonify({
+        return _json({
             'status': 'success',
             'new_count': new_count,
             'total_connected': total_connected
@@ -250,7 +587,7 @@ def scan_more():
     except Exception as e:
         import traceback
         traceback.print_exc()
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return _json({'status': 'error', 'message': str(e)}, 500)
 
 @app.route('/api/rename', methods=['POST'])
 def rename_train():
@@ -261,20 +598,21 @@ def rename_train():
         new_name = data.get('name', '').strip()
         
         if not train_id or train_id not in trains:
-            return jsonify({'status': 'error', 'message': 'Invalid train ID'}), 400
+            return _json({'status': 'error', 'message': 'Invalid train ID'}, 400)
         
         if not new_name:
-            return jsonify({'status': 'error', 'message': 'Name cannot be empty'}), 400
+            return _json({'status': 'error', 'message': 'Name cannot be empty'}, 400)
         
-        trains[train_id]['name'] = new_name
+        trains[train_id].name = new_name
+        _refresh_status_cache()
         
-        return jsonify({
+        return _json({
             'status': 'success',
             'train_id': train_id,
             'name': new_name
         })
     except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return _json({'status': 'error', 'message': str(e)}, 500)
 
 @app.route('/api/speed', methods=['POST'])
 def set_speed():
@@ -284,11 +622,30 @@ def set_speed():
         train_id = data.get('train_id', 'train1')
         speed = int(data.get('speed', 0))
         
-        run_coroutine_threadsafe(set_train_speed(train_id, speed))
+        # Only validate here - the write itself is queued without waiting
+        check_train_connected(train_id)
+        submit_coroutine(set_train_speed(train_id, speed))
         
-        return jsonify({'status': 'success', 'train_id': train_id, 'speed': speed})
+        return _json({'status': 'success', 'train_id': train_id, 'speed': speed})
     except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return _json({'status': 'error', 'message': str(e)}, 500)
+
+@sock.route('/ws/control')
+def control_socket(ws):
+    """Receive live speed updates from the sliders over a WebSocket.
+    
+    Frames are JSON objects like {"train": "<id>", "speed": N}. Nothing is
+    sent back unless a speed can't be queued.
+    """
+    while True:
+        message = ws.receive()
+        try:
+            data = orjson.loads(message)
+            speed = int(data['speed'])
+            check_train_connected(data['train'])
+            submit_coroutine(set_train_speed(data['train'], speed))
+        except Exception as e:
+            ws.send(orjson.dumps({'status': 'error', 'message': str(e)}).decode())
 
 @app.route('/api/speed/all', methods=['POST'])
 def set_speed_all():
@@ -298,15 +655,17 @@ def set_speed_all():
         speed = int(data.get('speed', 0))
         
         async def set_all_speeds():
-            for train_id in trains:
-                if trains[train_id]['client'] and trains[train_id]['client'].is_connected:
-                    await set_train_speed(train_id, speed)
+            await asyncio.gather(*(
+                set_train_speed(train_id, speed)
+                for train_id, train in trains.items()
+                if train.client and train.client.is_connected
+            ))
         
-        run_coroutine_threadsafe(set_all_speeds())
+        submit_coroutine(set_all_speeds())
         
-        return jsonify({'status': 'success', 'speed': speed})
+        return _json({'status': 'success', 'speed': speed})
     except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return _json({'status': 'error', 'message': str(e)}, 500)
 
 @app.route('/api/stop', methods=['POST'])
 def stop():
@@ -315,56 +674,59 @@ def stop():
         data = request.get_json()
         train_id = data.get('train_id', 'train1')
         
-        run_coroutine_threadsafe(set_train_speed(train_id, 0))
+        check_train_connected(train_id)
+        submit_coroutine(set_train_speed(train_id, 0))
         
-        return jsonify({'status': 'success', 'train_id': train_id, 'speed': 0})
+        return _json({'status': 'success', 'train_id': train_id, 'speed': 0})
     except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return _json({'status': 'error', 'message': str(e)}, 500)
 
 @app.route('/api/stop/all', methods=['POST'])
 def stop_all():
     """Stop all connected trains."""
     try:
         async def stop_all_trains():
-            for train_id, train in trains.items():
-                if train['client'] and train['client'].is_connected:
-                    await set_train_speed(train_id, 0)
+            await asyncio.gather(*(
+                set_train_speed(train_id, 0)
+                for train_id, train in trains.items()
+                if train.client and train.client.is_connected
+            ))
         
-        run_coroutine_threadsafe(stop_all_trains())
+        submit_coroutine(stop_all_trains())
         
-        return jsonify({'status': 'success', 'message': 'All trains stopped'})
+        return _json({'status': 'success', 'message': 'All trains stopped'})
     except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return _json({'status': 'error', 'message': str(e)}, 500)
 
 @app.route('/api/debug/<train_id>', methods=['GET'])
 def get_debug_info(train_id):
     """Get debug information about a specific train."""
     try:
         if train_id not in trains:
-            return jsonify({'status': 'error', 'message': 'Invalid train ID'}), 400
+            return _json({'status': 'error', 'message': 'Invalid train ID'}, 400)
         
         info = run_coroutine_threadsafe(get_train_info(train_id))
         
         if info:
-            return jsonify({'status': 'success', 'info': info})
+            return _json({'status': 'success', 'info': info})
         else:
-            return jsonify({'status': 'error', 'message': 'Train not connected'}), 404
+            return _json({'status': 'error', 'message': 'Train not connected'}, 404)
     except Exception as e:
         import traceback
         traceback.print_exc()
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return _json({'status': 'error', 'message': str(e)}, 500)
 
 if __name__ == '__main__':
     print("🚂 LEGO Train Control Web App")
+    configure_connection_interval()
     print("Starting background event loop...")
     
     # Start the background event loop in a separate thread
     background_thread = threading.Thread(target=start_background_loop, daemon=True)
     background_thread.start()
     
-    # Give the loop time to start
-    import time
-    time.sleep(0.5)
+    # Wait for the loop to be running before accepting requests
+    _loop_ready.wait()
     
     print("Open your browser to: http://localhost:5000")
     print("Make sure your train is powered on!")